@@ -2,20 +2,38 @@
 import os
 import sys
 import re
+import hashlib
+import io
+from html import escape
+import functools
+import threading
+import shutil
+import json
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 from PySide6 import QtCore, QtGui, QtWidgets
-from PySide6.QtCore import Qt, Signal, QRunnable, QThreadPool, QObject
+from PySide6.QtCore import Qt, Signal, QRunnable, QThreadPool, QObject, QTimer
 
 # Markdown -> HTML
+import xml.etree.ElementTree as etree
 import markdown
+import pymdownx
+import pymdownx.highlight
+import markdown.extensions.codehilite
+from markdown.extensions import Extension
 from markdown.extensions.toc import TocExtension
+from markdown.treeprocessors import Treeprocessor
 from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
 
 # HTML/CSS -> PDF
-from weasyprint import HTML, CSS
+from weasyprint import HTML, CSS, __version__ as weasyprint_version
+from weasyprint.text.fonts import FontConfiguration
 
 
 # --------------------------
@@ -24,10 +42,7 @@ from weasyprint import HTML, CSS
 
 MD_EXTENSIONS = [
     # Common + GitHub-like
-    "extra",                  # tables, fenced_code, etc.
-    "abbr",
-    "attr_list",
-    "def_list",
+    "extra",                  # tables, fenced_code, abbr, attr_list, def_list, etc.
     "sane_lists",
     "smarty",
     "nl2br",
@@ -65,53 +80,169 @@ MD_EXT_CONFIGS = {
 }
 
 
+# Маркер callout в начале первого абзаца цитаты: "[!note] Заголовок"
+_CALLOUT_RE = re.compile(r"^[ \t]*\[!(?P<type>[A-Za-z]+)\][ \t]*(?P<title>[^\n]*)\n?")
+
+
+class CalloutTreeprocessor(Treeprocessor):
+    """
+    Obsidian callouts прямо при конвертации:
+    > [!note] Заголовок
+    > текст...
+    превращается в
+    <blockquote><span data-callout="note">Заголовок</span><p>текст...</p></blockquote>
+    Работает до inline-обработки, поэтому заголовок и текст
+    проходят обычную markdown-разметку.
+    Callouts через пустую строку markdown сливает в одну цитату, поэтому
+    маркер ищется в каждом абзаце цитаты, а не только в первом.
+    """
+
+    def run(self, root):
+        for bq in list(root.iter("blockquote")):
+            for p in list(bq):
+                if p.tag != "p" or not p.text:
+                    continue
+                m = _CALLOUT_RE.match(p.text)
+                if not m:
+                    continue
+
+                badge = etree.Element("span", {"data-callout": m.group("type").lower()})
+                badge.text = m.group("title").strip()
+                idx = list(bq).index(p)
+                rest = p.text[m.end():]
+                if rest.strip() or len(p):
+                    p.text = rest
+                else:
+                    bq.remove(p)
+                bq.insert(idx, badge)
+
+
+class CalloutExtension(Extension):
+    # имя в ключе кэша HTML; модуль класса для этого не годится: в
+    # spawn-воркерах это "__mp_main__", а в GUI-процессе "__main__"
+    cache_name = "obsidian_callout"
+
+    def extendMarkdown(self, md):
+        # выше "inline" (20), чтобы заголовок callout тоже обработался
+        md.treeprocessors.register(CalloutTreeprocessor(md), "obsidian_callout", 25)
+
+
+MD_EXTENSIONS.append(CalloutExtension())
+
+
+def _ext_name(ext) -> str:
+    return ext if isinstance(ext, str) else ext.cache_name
+
+
+# Версия собственной обработки (CalloutTreeprocessor и т.п.): поднимать при
+# любом изменении, влияющем на HTML, чтобы сбросить кэш
+RENDER_VERSION = 2
+
+
+# Ключ конфигурации рендера: меняется вместе с расширениями/версиями,
+# чтобы кэш HTML не отдавал результат от старой конфигурации.
+EXT_KEY = repr((
+    RENDER_VERSION,
+    markdown.__version__,
+    pymdownx.__version__,
+    [_ext_name(e) for e in MD_EXTENSIONS],
+    sorted(MD_EXT_CONFIGS.items()),
+)).encode("utf-8")
+
+MD_CACHE_DIR = Path.home() / ".obsidian_md2pdf_cache"
+MD_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+
 def load_text(p: Path) -> str:
-    with p.open("r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
+    # read_bytes читает файл за один раз по известному размеру
+    return p.read_bytes().decode("utf-8", errors="ignore")
 
 
 def preprocess_obsidian(text: str) -> str:
     """
     Минимальный препроцессинг под Obsidian:
-    - Превращаем callouts (> [!note] ...) в улучшенные blockquote.
-    - Нормализуем табы/концы строк.
+    - Нормализуем концы строк.
+    Callouts (> [!note] ...) обрабатывает CalloutTreeprocessor.
     """
     # Нормализуем переводы строк
     text = text.replace("\r\n", "\n").replace("\r", "\n")
 
-    # Простейшая обработка callouts: оставляем как blockquote,
-    # но добавляем CSS класс через HTML-комментарий-признак.
-    # Пример:
-    # > [!note] Заголовок
-    # > текст...
-    # превратим в
-    # > <!--callout:note title="Заголовок"-->
-    # > текст...
-    def repl_callout(match):
-        t = match.group("type").lower()
-        title = (match.group("title") or "").strip()
-        # Вставим маркер классa
-        if title:
-            return f'> <!--callout:{t} title="{title}"-->'
-        else:
-            return f"> <!--callout:{t}-->"
+    return text
 
-    text = re.sub(
-        r"^[ \t]*>[ \t]*\[\!(?P<type>[A-Za-z]+)\][ \t]*(?P<title>.*)?$",
-        repl_callout,
-        text,
-        flags=re.MULTILINE,
-    )
 
-    return text
+# Экземпляр Markdown на поток: загрузка расширений дорогая, а между файлами
+# достаточно reset(). Markdown не потокобезопасен, поэтому не общий.
+_tls = threading.local()
 
 
 def build_markdown_html(md_text: str) -> str:
-    md = markdown.Markdown(extensions=MD_EXTENSIONS, extension_configs=MD_EXT_CONFIGS)
-    html = md.convert(md_text)
+    md = getattr(_tls, "md", None)
+    if md is None:
+        md = markdown.Markdown(extensions=MD_EXTENSIONS, extension_configs=MD_EXT_CONFIGS)
+        _tls.md = md
+    html = md.reset().convert(md_text)
     return html
 
 
+@functools.lru_cache(maxsize=4096)
+def md_to_html_cached(md_text: str, ext_key: bytes = EXT_KEY, cache_dir: Path = MD_CACHE_DIR) -> str:
+    """
+    build_markdown_html с кэшем по содержимому:
+    - в памяти (LRU) для повторных запусков в одной сессии;
+    - на диске: cache_dir/<k[:2]>/<k>.html, k = sha256(текст + ext_key).
+    Ошибки чтения/записи кэша не фатальны — просто рендерим заново.
+    """
+    key = hashlib.sha256(md_text.encode("utf-8") + ext_key).hexdigest()[:32]
+    cached = cache_dir / key[:2] / f"{key}.html"
+    try:
+        html = cached.read_text(encoding="utf-8")
+        os.utime(cached)  # для вытеснения по давности использования
+        return html
+    except OSError:
+        pass
+
+    html = build_markdown_html(md_text)
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(html, encoding="utf-8")
+        os.replace(tmp, cached)
+    except OSError:
+        pass
+    return html
+
+
+@functools.lru_cache(maxsize=256)
+def _lookup_lexer(alias, options: tuple):
+    try:
+        return get_lexer_by_name(alias, **dict(options))
+    except ClassNotFound:
+        # промах тоже кэшируем: на нём Pygments перебирает plugin entry points
+        return None
+
+
+def cached_get_lexer_by_name(alias, **options):
+    """
+    get_lexer_by_name с кэшем для codehilite/superfences: лексер ищется на
+    каждый блок кода, а неизвестные языки (mermaid, dataview...) — дорогие.
+    """
+    key = tuple(sorted(options.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return get_lexer_by_name(alias, **options)
+    lexer = _lookup_lexer(alias, key)
+    if lexer is None:
+        raise ClassNotFound(f"no lexer for alias {alias!r} found")
+    return lexer
+
+
+# Оба модуля импортируют get_lexer_by_name к себе — подменяем там
+markdown.extensions.codehilite.get_lexer_by_name = cached_get_lexer_by_name
+pymdownx.highlight.get_lexer_by_name = cached_get_lexer_by_name
+
+
+@functools.cache
 def pygments_css() -> str:
     fmt = HtmlFormatter(style="default")
     return fmt.get_style_defs(".codehilite")
@@ -121,6 +252,7 @@ def pygments_css() -> str:
 # PDF CSS themes (Obsidian-like)
 # --------------------------
 
+@functools.lru_cache(maxsize=8)
 def pdf_css_base(font_family: str) -> str:
     return f"""
 /* Page & typography */
@@ -328,11 +460,11 @@ span[data-callout]::before {{
 table {{
     margin: 0;
 }}
-/* Utility to transform our comment markers into attributes via CSS Generated Content is limited in PDF.
-   Instead, we will inject a tiny JS-less hint in HTML builder. We'll parse comment markers and wrap first <p> in a span. */
+/* Callout badges (span[data-callout]) are injected by CalloutTreeprocessor during markdown conversion. */
 """
 
 
+@functools.cache
 def pdf_css_theme_light() -> str:
     return """
 :root {
@@ -362,6 +494,7 @@ a { color: #3a74ff; }
 """
 
 
+@functools.cache
 def pdf_css_theme_dark() -> str:
     return """
 :root {
@@ -391,50 +524,12 @@ a { color: #8aa2ff; }
 """
 
 
-def wrap_html_document(body_html: str, theme: str, font_family: str, title: str = "") -> str:
+@functools.lru_cache(maxsize=8)
+def document_css(theme: str, font_family: str) -> str:
     theme_css = pdf_css_theme_dark() if theme == "Dark" else pdf_css_theme_light()
     css_base = pdf_css_base(font_family)
     pyg_css = pygments_css()
-
-    # Преобразуем комментарии callout в data-атрибут на первом параграфе цитаты.
-    # Ищем pattern <!--callout:type title="...--> внутри blockquote.
-    def transform_callouts(html: str) -> str:
-        def repl(m):
-            inner = m.group(1)
-            # ищем первый комментарий callout
-            cm = re.search(r"<!--\s*callout:([a-z]+)(?:\s+title=\"([^\"]*)\")?\s*-->", inner)
-            if not cm:
-                return m.group(0)
-            ctype = cm.group(1)
-            ctitle = cm.group(2) or ""
-            # добавим span в начало внутреннего контента
-            badge = (
-                f'<span data-callout="{ctype}">{ctitle}</span>'
-                if ctitle
-                else f'<span data-callout="{ctype}"></span>'
-            )
-            inner2 = re.sub(r"<!--\s*callout:[^>]*-->\s*", "", inner, count=1)
-            # вставим бейдж перед первым блочным элементом
-            inner2_new = re.sub(r"^(<p[^>]*>)", r"\1" + badge + " ", inner2, count=1)
-            # если нет <p>, вставим просто в начало
-            if inner2_new == inner2:
-                inner2_new = badge + inner2
-            return f"<blockquote>{inner2_new}</blockquote>"
-
-        return re.sub(r"<blockquote>(.*?)</blockquote>", repl, html, flags=re.DOTALL)
-
-    body_with_callouts = transform_callouts(body_html)
-
-    # добавляем заголовок файла в HTML
-    header_html = f'<h1 class="doc-title">{title}</h1>'
-
-    return f"""<!DOCTYPE html>
-    <html lang="ru">
-    <head>
-      <meta charset="utf-8" />
-      <meta name="viewport" content="width=device-width, initial-scale=1" />
-      <title>{title}</title>
-      <style>
+    return f"""
         {css_base}
         {theme_css}
         /* Pygments */
@@ -448,20 +543,227 @@ def wrap_html_document(body_html: str, theme: str, font_family: str, title: str
           border-bottom: 2px solid var(--divider);
           padding-bottom: 0.3em;
         }}
-      </style>
+    """
+
+
+# Неизменные части документа: собираются один раз, на файл подставляется
+# только заголовок (стили передаются в WeasyPrint отдельно).
+_DOC_HEAD = """<!DOCTYPE html>
+    <html lang="ru">
+    <head>
+      <meta charset="utf-8" />
+      <meta name="viewport" content="width=device-width, initial-scale=1" />
+      <title>{title}</title>
     </head>
     <body>
-      {header_html}
-      {body_with_callouts}
+      <h1 class="doc-title">{title}</h1>
+"""
+_DOC_TAIL = """
     </body>
     </html>
+"""
+
+
+def wrap_body_only(body_html: str, title: str = "") -> List[str]:
     """
+    Документ списком фрагментов — render_pdf пишет их в буфер по очереди,
+    без промежуточной склейки всего HTML в одну строку.
+    """
+    # имя файла может содержать <, & и т.п. — экранируем
+    return [_DOC_HEAD.format(title=escape(title)), body_html, _DOC_TAIL]
 
 
 # --------------------------
 # Conversion worker (thread)
 # --------------------------
 
+# Меньше файлов — конвертируем по одному в потоке задачи: запуск процессов
+# (импорт WeasyPrint/PySide6 в каждом) дороже самой конвертации.
+PROCESS_POOL_MIN_FILES = 4
+
+# ProcessPoolExecutor на Windows не принимает больше 61 процесса
+MAX_POOL_WORKERS = 61 if sys.platform == "win32" else None
+
+PDF_WRITE_BUFFER = 1 << 20
+
+# Готовые PDF по хэшу (HTML + CSS + base_url): вёрстка WeasyPrint — самый
+# дорогой шаг, а при том же входе результат тот же.
+PDF_CACHE_DIR = MD_CACHE_DIR / "pdf"
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Ресурсы, которые WeasyPrint загружает при вёрстке: картинки, url() в стилях,
+# <object data>, <link href> (стили). Их изменение не видно по HTML, поэтому
+# такие документы не кэшируем. Встроенные data: URI — не внешние ресурсы;
+# кавычка разобрана отдельными ветками, чтобы (?!data:) не обходился откатом.
+_RESOURCE_VALUE = rb"""\s*(?:"(?!data:)|'(?!data:)|(?!["'\s]|data:))"""
+_RESOURCE_REF_RE = re.compile(
+    rb"(?:\bsrc\s*=|\burl\(|<object\b[^>]*?\bdata\s*=|<link\b[^>]*?\bhref\s*=)" + _RESOURCE_VALUE,
+    re.IGNORECASE,
+)
+
+
+def references_resources(html_bytes: bytes) -> bool:
+    return _RESOURCE_REF_RE.search(html_bytes) is not None
+
+
+def convert_one(md_path: Path) -> List[str]:
+    text = load_text(md_path)
+    text = preprocess_obsidian(text)
+    body_html = md_to_html_cached(text)
+    doc_title = md_path.stem
+    return wrap_body_only(body_html, title=doc_title)
+
+
+def pdf_stylesheets(css: str):
+    """
+    FontConfiguration и разобранный CSS для текущего потока: WeasyPrint
+    не разбирает @font-face/@page заново для каждого файла.
+    Объекты WeasyPrint не picklable и не потокобезопасны, поэтому
+    создаются лениво в каждом воркере, а не в ConvertTask.
+    """
+    cached = getattr(_tls, "stylesheets", None)
+    if cached is None or cached[0] != css:
+        font_config = FontConfiguration()
+        cached = (css, font_config, [CSS(string=css, font_config=font_config)])
+        _tls.stylesheets = cached
+    return cached[1], cached[2]
+
+
+def render_pdf(html_parts: List[str], base_url: Path, out_pdf: Path, css: str):
+    out_pdf.parent.mkdir(parents=True, exist_ok=True)
+    buf = io.BytesIO()
+    h = hashlib.sha256(f"{weasyprint_version}\0{base_url}\0{css}\0".encode("utf-8"))
+    cacheable = True
+    for part in html_parts:
+        data = part.encode("utf-8")
+        buf.write(data)
+        h.update(data)
+        if cacheable and references_resources(data):
+            cacheable = False
+    key = h.hexdigest()
+    cached = PDF_CACHE_DIR / key[:2] / f"{key}.pdf" if cacheable else None
+    if cached is not None:
+        try:
+            _copy_replace(cached, out_pdf)
+            os.utime(cached)  # для вытеснения по давности использования
+            return
+        except OSError:
+            pass
+
+    font_config, stylesheets = pdf_stylesheets(css)
+    buf.seek(0)
+    # PDF пишется крупными блоками через свой буфер во временный файл рядом
+    # и подменяет прежний только после успешной вёрстки
+    tmp_pdf = out_pdf.with_name(out_pdf.name + ".tmp")
+    try:
+        with open(tmp_pdf, "wb", buffering=PDF_WRITE_BUFFER) as fh:
+            HTML(file_obj=buf, encoding="utf-8", base_url=str(base_url)).write_pdf(
+                target=fh, stylesheets=stylesheets, font_config=font_config
+            )
+        os.replace(tmp_pdf, out_pdf)
+    except BaseException:
+        try:
+            tmp_pdf.unlink(missing_ok=True)
+        except OSError:
+            pass
+        raise
+
+    if cached is not None:
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            _copy_replace(out_pdf, cached)
+        except OSError:
+            pass
+
+
+def _copy_replace(src: Path, dst: Path):
+    # копия через временный файл: dst либо прежний, либо целиком новый
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+        raise
+
+
+def prune_cache():
+    """Ограничивает размер кэшей HTML и PDF, удаляя давно не использованное."""
+    _prune_files(MD_CACHE_DIR.glob("*/*.html"), MD_CACHE_MAX_BYTES)
+    _prune_files(PDF_CACHE_DIR.glob("*/*.pdf"), PDF_CACHE_MAX_BYTES)
+
+
+def _prune_files(paths, max_bytes: int):
+    entries = []
+    total = 0
+    for p in paths:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+        total += st.st_size
+    if total <= max_bytes:
+        return
+    entries.sort()
+    for _, size, p in entries:
+        try:
+            p.unlink()
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def manifest_path(out_pdf: Path) -> Path:
+    return out_pdf.with_suffix(".pdf.manifest.json")
+
+
+def source_signature(md_path: Path, data: bytes, css: str) -> dict:
+    """Всё, от чего зависит PDF: исходник, его путь, CSS и настройки markdown."""
+    return {
+        "src": str(md_path),
+        "src_mtime": md_path.stat().st_mtime_ns,
+        "src_hash": hashlib.sha256(data).hexdigest(),
+        "css_hash": hashlib.sha256(css.encode("utf-8")).hexdigest(),
+        "md_hash": hashlib.sha256(EXT_KEY).hexdigest(),
+    }
+
+
+def loads_resources(data: bytes) -> bool:
+    """
+    Подгружает ли заметка картинки и т.п. — их изменения манифест не
+    видит. Проверка та же, что у кэша PDF, по HTML (обычно из кэша HTML).
+    """
+    text = preprocess_obsidian(data.decode("utf-8", errors="ignore"))
+    return references_resources(md_to_html_cached(text).encode("utf-8"))
+
+
+def is_up_to_date(out_pdf: Path, sig: dict) -> bool:
+    try:
+        return out_pdf.exists() and json.loads(manifest_path(out_pdf).read_text("utf-8")) == sig
+    except (OSError, ValueError):
+        return False
+
+
+def format_error(e: BaseException) -> str:
+    return "".join(traceback.format_exception_only(type(e), e)).strip()
+
+
+def _convert_file_worker(md_path: Path, out_pdf: Path, css: str) -> Path:
+    """
+    Конвертация одного файла в пуле. Функция модульного уровня и только
+    picklable-аргументы — иначе ProcessPoolExecutor её не передаст.
+    """
+    html_parts = convert_one(md_path)
+    render_pdf(html_parts, md_path.parent, out_pdf, css)
+    return out_pdf
+
+
 class WorkerSignals(QObject):
     progress = Signal(int, int)         # current, total
     message = Signal(str)               # log lines
@@ -472,7 +774,7 @@ class WorkerSignals(QObject):
 class ConvertTask(QRunnable):
     def __init__(
         self,
-        files: List[Path],
+        files: Sequence[Path],
         out_dir: Path,
         theme: str,
         font_family: str,
@@ -489,21 +791,121 @@ class ConvertTask(QRunnable):
         self.signals = WorkerSignals()
 
     def run(self):
+        # что бы ни случилось, GUI должен получить done или error — иначе
+        # интерфейс останется заблокированным
+        try:
+            results = self._convert_all()
+        except Exception as e:
+            self.signals.error.emit(format_error(e))
+            return
+        self.signals.done.emit(results)
+
+    def _convert_all(self) -> list:
         results = []
         total = len(self.files)
-        for i, md_path in enumerate(self.files, start=1):
-            try:
-                self.signals.progress.emit(i, total)
-                self.signals.message.emit(f"Конвертация: {md_path}")
-                html, output_pdf = self.convert_one(md_path)
-                self.render_pdf(html, md_path.parent, output_pdf)
+        done_count = 0
+        # CSS один на весь прогон — собираем здесь, а не в каждом воркере
+        css = document_css(self.theme, self.font_family)
+
+        def report(md_path: Path, output_pdf: Optional[Path], err: str = "", cached: bool = False):
+            nonlocal done_count
+            done_count += 1
+            self.signals.progress.emit(done_count, total)
+            if output_pdf is not None:
                 results.append((str(md_path), str(output_pdf), True, ""))
-                self.signals.message.emit(f"✓ Готово: {output_pdf}")
-            except Exception as e:
-                err = "".join(traceback.format_exception_only(type(e), e)).strip()
+                if cached:
+                    self.signals.message.emit(f"= Без изменений: {output_pdf}")
+                else:
+                    self.signals.message.emit(f"✓ Готово: {md_path} → {output_pdf}")
+            else:
                 results.append((str(md_path), "", False, err))
                 self.signals.message.emit(f"✗ Ошибка: {md_path}\n  {err}")
-        self.signals.done.emit(results)
+
+        # Неизменившиеся файлы пропускаем по манифесту рядом с PDF
+        signatures = {}
+        pending: List[Path] = []
+        for md_path in self.files:
+            try:
+                data = md_path.read_bytes()
+                sig = source_signature(md_path, data, css)
+            except OSError:
+                pending.append(md_path)  # ошибку покажет конвертация
+                continue
+            out_pdf = self._compute_out_path(md_path)
+            if is_up_to_date(out_pdf, sig):
+                try:
+                    skip = not loads_resources(data)
+                except Exception:
+                    skip = False  # ошибку покажет конвертация
+                if skip:
+                    report(md_path, out_pdf, cached=True)
+                    continue
+            signatures[md_path] = sig
+            pending.append(md_path)
+
+        def complete(md_path: Path, output_pdf: Optional[Path], err: str = ""):
+            unfinished.discard(md_path)
+            if output_pdf is None:
+                report(md_path, None, err)
+                return
+            # манифест пишем только после успешного PDF
+            sig = signatures.get(md_path)
+            if sig is not None:
+                try:
+                    manifest_path(output_pdf).write_text(json.dumps(sig), "utf-8")
+                except OSError:
+                    pass
+            report(md_path, output_pdf)
+
+        unfinished = set(pending)
+        jobs = len(pending)
+        if jobs < PROCESS_POOL_MIN_FILES:
+            # WeasyPrint держит GIL, потоки не ускорят — по одному файлу
+            for md_path in pending:
+                self.signals.message.emit(f"Конвертация: {md_path}")
+                try:
+                    output_pdf = _convert_file_worker(md_path, self._compute_out_path(md_path), css)
+                except Exception as e:
+                    complete(md_path, None, format_error(e))
+                    continue
+                complete(md_path, output_pdf)
+        else:
+            # WeasyPrint держит GIL во время вёрстки, поэтому процессы.
+            # spawn — fork из процесса с потоками Qt небезопасен.
+            workers = max(1, min(jobs, os.cpu_count() or 1, MAX_POOL_WORKERS or jobs))
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    self.signals.message.emit(f"Конвертация: {jobs} файл(ов), процессов: {workers}")
+                    futures = {}
+                    for md_path in pending:
+                        fut = executor.submit(
+                            _convert_file_worker, md_path, self._compute_out_path(md_path), css
+                        )
+                        futures[fut] = md_path
+
+                    # в параллельном режиме путь исходника пишется вместе с результатом
+                    for fut in as_completed(futures):
+                        md_path = futures[fut]
+                        try:
+                            output_pdf = fut.result()
+                        except Exception as e:
+                            complete(md_path, None, format_error(e))
+                            continue
+                        complete(md_path, output_pdf)
+            except Exception as e:
+                # пул не создался или сломался (BrokenProcessPool и т.п.) —
+                # всё, что не успело завершиться, считаем ошибкой
+                err = format_error(e)
+                for md_path in [p for p in pending if p in unfinished]:
+                    complete(md_path, None, err)
+
+        try:
+            prune_cache()
+        except OSError:
+            pass
+        return results
 
     def _compute_out_path(self, md_path: Path) -> Path:
         # Базовое имя файла
@@ -518,22 +920,6 @@ class ConvertTask(QRunnable):
         else:
             return self.out_dir / safe_name
 
-    def convert_one(self, md_path: Path):
-        text = load_text(md_path)
-        text = preprocess_obsidian(text)
-        body_html = build_markdown_html(text)
-        doc_title = md_path.stem
-        full_html = wrap_html_document(
-            body_html, theme=self.theme, font_family=self.font_family, title=doc_title
-        )
-
-        out_pdf = self._compute_out_path(md_path)
-        return full_html, out_pdf
-
-    def render_pdf(self, html_str: str, base_url: Path, out_pdf: Path):
-        out_pdf.parent.mkdir(parents=True, exist_ok=True)
-        HTML(string=html_str, base_url=str(base_url)).write_pdf(str(out_pdf))
-
 
 # --------------------------
 # GUI
@@ -632,14 +1018,28 @@ def pick_out_dir(parent) -> Optional[Path]:
 
 def collect_md_in_dir(root: Path) -> List[Path]:
     res = []
-    for p in root.rglob("*.md"):
-        # игнорируем .obsidian и скрытые каталоги
-        parts = set(part.lower() for part in p.parts)
-        if ".obsidian" in parts:
-            continue
-        if any(seg.startswith(".") for seg in p.parts):
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
             continue
-        res.append(p)
+        with it:
+            for e in it:
+                name = e.name
+                # игнорируем .obsidian и скрытые каталоги — даже не заходим в них
+                if name.startswith("."):
+                    continue
+                try:
+                    is_dir = e.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    stack.append(e.path)
+                elif name.lower().endswith(".md"):
+                    res.append(Path(e.path))
+    res.sort()
     return res
 
 
@@ -688,6 +1088,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # State
         self.files: List[Path] = []
+        # Общий префикс папок файлов (Path.parts), ведётся при добавлении/удалении
+        self._common_parts: Optional[tuple] = None
         self.out_dir: Path = Path.home() / "Desktop"
         self.theme = "Light"  # 'Light'|'Dark'
         self.font_family = "JetBrains Mono"
@@ -699,6 +1101,13 @@ class MainWindow(QtWidgets.QMainWindow):
         # Thread pool
         self.pool = QThreadPool.globalInstance()
 
+        # Лог пишется пачками: append() на каждую строку перестраивает документ
+        self._log_buf: List[str] = []
+        self._log_timer = QTimer(self)
+        self._log_timer.setSingleShot(True)
+        self._log_timer.setInterval(50)
+        self._log_timer.timeout.connect(self._flush_log)
+
         self._build_ui()
         self._connect()
         self._toggle_preserve_ui(self.preserve_structure)
@@ -784,6 +1193,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.log = QtWidgets.QTextEdit()
         self.log.setReadOnly(True)
         self.log.setPlaceholderText("Лог выполнения…")
+        self.log.document().setMaximumBlockCount(5000)
         layout.addWidget(self.log, 1)
 
         # Style
@@ -830,6 +1240,7 @@ class MainWindow(QtWidgets.QMainWindow):
             if p in self.files:
                 continue
             self.files.append(p)
+            self._extend_common_parts(p)
             self.list_files.addItem(str(p))
             added += 1
         if added:
@@ -840,6 +1251,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def on_clear(self):
         self.files.clear()
+        self._common_parts = None
         self.list_files.clear()
         self._log("Список очищен.")
 
@@ -851,6 +1263,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.files.remove(p)
             row = self.list_files.row(it)
             self.list_files.takeItem(row)
+        if selected:
+            self._recompute_common_parts()
         self._log(f"Удалено: {len(selected)} (итого: {len(self.files)})")
         if self.chk_preserve.isChecked() and not self.ed_base.text().strip():
             self._update_base_root_autodetect()
@@ -905,7 +1319,7 @@ class MainWindow(QtWidgets.QMainWindow):
             if base_text:
                 base_root = Path(base_text)
             else:
-                base_root = self._common_base(self.files)
+                base_root = self._common_base()
             if base_root:
                 self._log(f"Базовая папка для структуры: {base_root}")
 
@@ -913,7 +1327,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.progress.setValue(0)
 
         task = ConvertTask(
-            self.files.copy(),
+            tuple(self.files),
             self.out_dir,
             self.theme,
             self.font_family,
@@ -954,7 +1368,14 @@ class MainWindow(QtWidgets.QMainWindow):
             w.setEnabled(not busy)
 
     def _log(self, text: str):
-        self.log.append(text)
+        self._log_buf.append(text)
+        if not self._log_timer.isActive():
+            self._log_timer.start()
+
+    def _flush_log(self):
+        if self._log_buf:
+            self.log.append("\n".join(self._log_buf))
+            self._log_buf.clear()
 
     def _toggle_preserve_ui(self, enabled: bool):
         self.lbl_base.setEnabled(enabled)
@@ -968,20 +1389,33 @@ class MainWindow(QtWidgets.QMainWindow):
     def _update_base_root_autodetect(self):
         if not self.files:
             return
-        base = self._common_base(self.files)
+        base = self._common_base()
         if base:
             self._set_base_root(base)
 
-    @staticmethod
-    def _common_base(paths: List[Path]) -> Optional[Path]:
-        try:
-            common = os.path.commonpath([str(p.resolve()) for p in paths])
-            return Path(common)
-        except Exception:
+    def _extend_common_parts(self, p: Path):
+        # пути в self.files уже resolve() при добавлении — без лишних syscalls
+        parts = p.parent.parts
+        if self._common_parts is None:
+            self._common_parts = parts
+        else:
+            self._common_parts = tuple(os.path.commonprefix([self._common_parts, parts]))
+
+    def _recompute_common_parts(self):
+        # после удаления префикс может только удлиниться — пересчёт по кортежам
+        self._common_parts = None
+        for p in self.files:
+            self._extend_common_parts(p)
+
+    def _common_base(self) -> Optional[Path]:
+        # пустой префикс — файлы на разных дисках
+        if not self._common_parts:
             return None
+        return Path(*self._common_parts)
 
 
 def main():
+    multiprocessing.freeze_support()
     app = QtWidgets.QApplication(sys.argv)
     font = QtGui.QFont("JetBrains Mono", 10)
     app.setFont(font)